@@ -0,0 +1,54 @@
+"""
+Converts dashboard_data.csv into the typed Parquet file the dashboard loads.
+
+Run it again whenever the CSV changes:  python build_parquet.py
+(needs pycountry, which the dashboard itself does not).
+"""
+import numpy as np
+import pandas as pd
+import pycountry
+
+CSV_PATH = "dashboard_data.csv"
+PARQUET_PATH = "dashboard_data.parquet"
+
+# OWID country names that pycountry does not resolve on its own
+ISO3_OVERRIDES = {
+    "Brunei": "BRN",
+    "Cape Verde": "CPV",
+    "Cote d'Ivoire": "CIV",
+    "Democratic Republic of Congo": "COD",
+    "East Timor": "TLS",
+    "Micronesia (country)": "FSM",
+    "Russia": "RUS",
+    "Turkey": "TUR",
+}
+
+def to_iso3(name):
+    # None for regional aggregates such as "World" or "Africa", which have no shape on the map
+    if name in ISO3_OVERRIDES:
+        return ISO3_OVERRIDES[name]
+    try:
+        return pycountry.countries.lookup(name).alpha_3
+    except LookupError:
+        return None
+
+def build(csv_path=CSV_PATH, parquet_path=PARQUET_PATH):
+    # Every CSV column is kept: the "Download Filtered Data" export hands the rows back as-is
+    df = pd.read_csv(csv_path, engine="pyarrow", dtype={"country": "category"})
+    df = df.dropna(subset=["crude_mortality", "year", "country"]).reset_index(drop=True)
+    df["country"] = df["country"].cat.remove_unused_categories()
+    # Resolved once per country name, so the map needs no name matching in the browser
+    df["iso3"] = df["country"].map({c: to_iso3(c) for c in df["country"].cat.categories}).astype("category")
+
+    # Crude Mortality * Population / 100,000, truncated like the metric card always showed it
+    df["estimated_total_suicides"] = np.trunc(df["crude_mortality"] * df["population"] / 100000).astype("Int32")
+
+    # Rates and population stay float64: float32 shifts some rates across a rounding
+    # boundary (South Korea 2021 would show 20.58 instead of 20.57 per 100k)
+    df = df.astype({"year": "int16"})
+    df.to_parquet(parquet_path, compression="zstd", index=False)
+    return df
+
+if __name__ == "__main__":
+    df = build()
+    print(f"Wrote {PARQUET_PATH}: {len(df):,} rows x {len(df.columns)} columns")
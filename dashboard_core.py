@@ -0,0 +1,285 @@
+"""
+Shared data loading, color mapping and cached figure builders for the dashboard.
+"""
+import streamlit as st
+import pandas as pd
+import numpy as np
+import plotly.graph_objects as go
+import plotly.io as pio
+import pyarrow.parquet as pq
+
+# Long OWID column name, spelled out once
+MF_COL = "male_to_female_suicide_death_rate_ratio_age_standardized"
+
+@st.cache_data
+def age_column_meta(cols):
+    # (column, label) pairs for the both-sexes age-group columns, e.g. "20–24"
+    cols = pd.Index(cols)
+    age_cols = cols[cols.str.contains("aged_", regex=False) & cols.str.contains("both_sexes", regex=False)]
+    labels = age_cols.str.extract(r"aged_(\d+_\d+|\d+\+)_year_olds", expand=False).str.replace("_", "–")
+    return list(zip(age_cols, np.where(labels.isna(), age_cols, labels).tolist()))
+
+# Columns the panels read, besides the age groups; the rest only matter to the CSV export
+KEEP_COLS = ["country", "year", "crude_mortality", MF_COL, "iso3", "estimated_total_suicides"]
+
+# Load data - It's good practice to cache this if the data is large and static
+# Shared rather than copied per rerun; nothing downstream mutates the frame
+@st.cache_resource
+def load_data(path):
+    # Pre-cleaned and typed by build_parquet.py, so there is nothing left to parse or cast
+    names = pq.read_schema(path).names
+    keep = [c for c in KEEP_COLS if c in names] + [c for c, _ in age_column_meta(tuple(names))]
+    return pd.read_parquet(path, columns=keep)
+
+# The derived caches below are keyed on the file path: hashing the frame on every
+# rerun, and unpickling a copy as st.cache_data does, costs more than the work they save
+@st.cache_resource
+def year_bundles(path, k=10):
+    # Everything the per-year panels need, computed once per year instead of per rerun.
+    # nlargest is a partial selection, cheaper than sorting each year in full
+    df = load_data(path)
+    out = {}
+    for y, sub in df.groupby("year", sort=False):
+        top10 = sub.nlargest(k, "crude_mortality")
+        # top10 already holds one row per country for the year, so no groupby is needed
+        vals = top10["crude_mortality"].to_numpy()
+        # Selectbox options as an immutable tuple, so the shared bundle can hand them out as-is
+        options = tuple(sorted(sub["country"].dropna().unique().tolist()))
+        out[y] = dict(sub=sub, options=options, top10=top10, share=top10[["country", "crude_mortality"]],
+                      top10_vals=vals, top10_min=vals.min(initial=np.inf), top10_max=vals.max(initial=-np.inf))
+    return out
+
+@st.cache_resource
+def index_country_year(path):
+    # Sorted (country, year) MultiIndex so single-row lookups skip the boolean masks
+    return load_data(path).set_index(["country", "year"]).sort_index()
+
+@st.cache_resource
+def trend_arrays(path):
+    # Per-country (years, crude mortality, M:F ratio) NumPy arrays, sorted by year
+    out = {}
+    for c, g in load_data(path).groupby("country", sort=False, observed=True):
+        g = g.sort_values("year")
+        out[c] = (g["year"].to_numpy(), g["crude_mortality"].to_numpy(),
+                  g[MF_COL].to_numpy() if MF_COL in g else None)
+    return out
+
+# Columns build_parquet.py adds for the dashboard's own use, kept out of the user's download
+BUILD_ONLY_COLS = ["iso3", "estimated_total_suicides"]
+
+def to_csv_bytes(path, year):
+    # Full-width rows straight from the file, since load_data keeps only the columns the panels use
+    rows = pd.read_parquet(path, filters=[("year", "==", year)])
+    return rows.drop(columns=BUILD_ONLY_COLS, errors="ignore").to_csv(index=False).encode()
+
+@st.cache_resource
+def mortality_range(path):
+    v = load_data(path)["crude_mortality"].to_numpy()
+    return float(np.nanmin(v)), float(np.nanmax(v))
+
+def kpi(idx, country, year):
+    """
+    Headline scalars for one country and year plus their change from the year before, None where missing.
+    """
+    def row(y):
+        key = (country, y)
+        return idx.loc[key] if key in idx.index else None
+
+    def value(r, col):
+        return r[col] if r is not None and col in idx.columns and pd.notna(r[col]) else None
+
+    def delta(a, b):
+        return a - b if a is not None and b is not None else None
+
+    cur, prev = row(year), row(year - 1)
+    out = {}
+    for name, col in (("cm", "crude_mortality"),
+                      ("mfr", MF_COL),
+                      ("total", "estimated_total_suicides")):
+        now, before = value(cur, col), value(prev, col)
+        if name == "total":
+            now, before = (int(v) if v is not None else None for v in (now, before))
+        out[name], out[f"{name}_delta"] = now, delta(now, before)
+    return out
+
+# Define a blue color scale (lighter for lower rates, darker for higher rates)
+BLUE_COLOR_SCALE = [
+    [0.0, "#E0F2F7"],  # Very Light Blue
+    [0.2, "#B3E0F2"],
+    [0.4, "#80CCEB"],
+    [0.6, "#4DB8E0"],
+    [0.8, "#1F77B4"],  # A standard blue (Plotly default)
+    [1.0, "#0A3B57"]   # Very Dark Blue
+]
+# Middle shade used whenever there is no variation or no value to map
+MID_BLUE = BLUE_COLOR_SCALE[len(BLUE_COLOR_SCALE)//2][1]
+
+def build_lut(scale, n=256):
+    """
+    Precomputes n hex colors by interpolating the color scale stops channel by channel.
+    """
+    xs = np.linspace(0.0, 1.0, n)
+    stops = np.array([s[0] for s in scale])
+    rgb = np.array([[int(h.lstrip('#')[i:i+2], 16) for i in (0, 2, 4)] for _, h in scale])
+    out = np.empty((n, 3), np.uint8)
+    for c in range(3):
+        out[:, c] = np.interp(xs, stops, rgb[:, c])
+    # Format every entry up front so lookups never touch string formatting
+    return np.array(["#%02x%02x%02x" % tuple(c) for c in out])
+
+def colors_for(values, min_val, max_val, lut):
+    """
+    Maps an array of values to hex colors through a precomputed lookup table.
+    """
+    values = np.asarray(values, dtype=float)
+    if not (max_val - min_val) > 0:
+        # Return a middle shade if there is no variation in the data
+        return [MID_BLUE] * len(values)
+
+    t = np.clip((values - min_val) / (max_val - min_val), 0.0, 1.0)
+    idx = (np.nan_to_num(t) * (len(lut) - 1)).astype(np.int32)
+    return np.where(np.isnan(values), MID_BLUE, lut[idx]).tolist()
+
+# Built once per process at import; a plain call, so importing this module runs no Streamlit command
+BLUE_LUT = build_lut(BLUE_COLOR_SCALE)
+
+# Trend series longer than this are downsampled before they are handed to Plotly
+MAX_TREND_POINTS = 800
+
+def lttb(x, y, n_out):
+    """
+    Largest-Triangle-Three-Buckets downsampling: keeps the n_out points that best preserve the line's shape.
+    """
+    x, y = np.asarray(x), np.asarray(y)
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return x, y
+
+    xf, yf = x.astype(float), y.astype(float)
+    # First and last points are always kept; the rest are split into n_out - 2 buckets
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    idx = np.empty(n_out, dtype=np.int64)
+    idx[0], idx[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        next_hi = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x, avg_y = xf[hi:next_hi].mean(), yf[hi:next_hi].mean()
+        # Pick the point forming the largest triangle with the previous pick and the next bucket's mean
+        area = np.abs((xf[a] - avg_x) * (yf[lo:hi] - yf[a]) - (xf[a] - xf[lo:hi]) * (avg_y - yf[a]))
+        a = lo + int(np.argmax(area))
+        idx[i + 1] = a
+    return x[idx], y[idx]
+
+# --- CACHED FIGURES ---
+# Resolved once so update_layout receives the template object instead of looking the name up per figure
+DARK_LAYOUT = dict(template=pio.templates["plotly_dark"])
+
+# Figures are shared across reruns and sessions. Builders that read frames take the file path and
+# the selection rather than the frame itself, so a cache hit never hashes a DataFrame.
+# st.cache_resource never evicts on its own, so each builder keeps at most this many figures
+FIGURE_CACHE_ENTRIES = 128
+
+@st.cache_resource(max_entries=FIGURE_CACHE_ENTRIES)
+def build_trend(years, rates, country, line_color):
+    # WebGL trace: the line is drawn in one GPU pass instead of an SVG path per point
+    years, rates = lttb(years, rates, MAX_TREND_POINTS)
+    fig = go.Figure(go.Scattergl(x=years, y=rates, name="",
+                                 mode="lines+markers", line=dict(color=line_color),
+                                 hovertemplate="year=%{x}<br>crude_mortality=%{y}<extra></extra>"))
+    fig.update_layout(title=f"Crude Mortality Over Time — {country}",
+                      **DARK_LAYOUT, xaxis_title="year", yaxis_title="crude_mortality")
+    return fig
+
+@st.cache_resource(max_entries=FIGURE_CACHE_ENTRIES)
+def build_age_bar(path, country, year):
+    age_labels = dict(age_column_meta(tuple(load_data(path).columns)))
+    age_data = index_country_year(path).loc[[(country, year)], list(age_labels)].T.dropna()
+    age_data.columns = ["rate"]
+    age_data = age_data.sort_values("rate")
+
+    age_data.index = age_data.index.map(age_labels)
+    age_data.index.name = "Age Group"
+
+    # Let Plotly map the rates onto the color scale in the browser
+    if not age_data.empty and age_data['rate'].max() - age_data['rate'].min() != 0:
+        marker_age = dict(color=age_data['rate'], colorscale=BLUE_COLOR_SCALE)
+    else: # Fallback to a single color if no variation or empty
+        marker_age = dict(color=MID_BLUE)
+
+
+    fig = go.Figure(go.Bar(
+        x=age_data.index,
+        y=age_data["rate"].to_numpy(),
+        marker=marker_age,
+        texttemplate="%{y:.2f}", textposition="auto", name="",
+        hovertemplate="Age Group=%{x}<br>Deaths per 100k=%{y}<extra></extra>"
+    ))
+    fig.update_layout(title=f"Suicide Rate by Age Group — {country} ({year})",
+                      **DARK_LAYOUT, xaxis_title="Age Group", yaxis_title="Deaths per 100k")
+    return fig
+
+@st.cache_resource(max_entries=FIGURE_CACHE_ENTRIES)
+def build_mf_ratio(years, ratios, country, line_color):
+    keep = ~np.isnan(ratios)
+    years, ratios = lttb(years[keep], ratios[keep], MAX_TREND_POINTS)
+    fig = go.Figure(go.Scattergl(x=years, y=ratios, name="",
+                                 mode="lines+markers", line=dict(color=line_color),
+                                 hovertemplate=f"year=%{{x}}<br>{MF_COL}=%{{y}}<extra></extra>"))
+    fig.update_layout(title=f"M:F Suicide Ratio — {country}",
+                      **DARK_LAYOUT, xaxis_title="year", yaxis_title=MF_COL)
+    return fig
+
+@st.cache_resource
+def base_choropleth():
+    # Styled once: projection, color axis and template; each year only swaps in its data
+    fig = go.Figure(go.Choropleth(locationmode="ISO-3", coloraxis="coloraxis", name="",
+                                  hovertemplate="country=%{text}<br>crude_mortality=%{z}<extra></extra>"))
+    fig.update_layout(coloraxis=dict(colorscale="Blues", colorbar=dict(title="crude_mortality")), **DARK_LAYOUT)
+    return fig
+
+@st.cache_resource(max_entries=FIGURE_CACHE_ENTRIES)
+def build_choropleth(path, year):
+    dfy = year_bundles(path)[year]["sub"]
+    # Regional aggregates ("World", "Africa", ...) have no ISO-3 code and no shape to fill
+    dfy = dfy[dfy["iso3"].notna()]
+    fig = go.Figure(base_choropleth()) # Copy, the base figure is shared and must stay untouched
+    fig.update_traces(locations=dfy["iso3"].to_numpy(), z=dfy["crude_mortality"].to_numpy(),
+                      text=dfy["country"].to_numpy())
+    fig.update_layout(title=f"Suicide Rate Map — {year}")
+    return fig
+
+@st.cache_resource(max_entries=FIGURE_CACHE_ENTRIES)
+def build_top10(path, year):
+    b = year_bundles(path)[year]
+    top10, vals, vmin, vmax = b["top10"], b["top10_vals"], b["top10_min"], b["top10_max"]
+    # Check if there's variation in data, a flat color scale has nothing to map
+    if vmax - vmin != 0:
+        marker_top10 = dict(color=vals, colorscale=BLUE_COLOR_SCALE)
+    else: # Fallback to a single color if no variation
+        marker_top10 = dict(color=MID_BLUE)
+
+
+    fig = go.Figure(go.Bar(x=top10["country"].to_numpy(), y=vals, marker=marker_top10,
+                           texttemplate="%{y:.2s}", textposition="auto", name="",
+                           hovertemplate="country=%{x}<br>crude_mortality=%{y}<extra></extra>"))
+    fig.update_layout(title=f"Top 10 Countries — {year}", showlegend=False,
+                      **DARK_LAYOUT, xaxis_title="country", yaxis_title="crude_mortality")
+    return fig
+
+@st.cache_resource(max_entries=FIGURE_CACHE_ENTRIES)
+def build_top10_share(path, year):
+    b = year_bundles(path)[year]
+    region_data, vals, vmin, vmax = b["share"], b["top10_vals"], b["top10_min"], b["top10_max"]
+    # Ensure there's variation for the pie chart colors too
+    if not region_data.empty and vmax - vmin != 0:
+        pie_colors = colors_for(vals, vmin, vmax, BLUE_LUT)
+    else: # Fallback to single color if no variation or empty
+        pie_colors = [MID_BLUE] * len(region_data) if not region_data.empty else []
+
+
+    fig = go.Figure(go.Pie(labels=region_data["country"].to_numpy(), values=vals,
+                           textinfo="percent+label", marker=dict(colors=pie_colors), name="",
+                           hovertemplate="country=%{label}<br>crude_mortality=%{value}<extra></extra>"))
+    fig.update_layout(title=f"Top 10 Country Share — {year}", **DARK_LAYOUT)
+    return fig